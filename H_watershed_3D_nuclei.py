@@ -29,10 +29,14 @@ Date              By        Comments
 #@ Integer(label="Volume threshold", description="Discard objects with volume BELOW that threshold", value=0) min_volume
 #@ Integer(label="DAPI intensity threshold", description="Discard objects with intensity value in DAPI channel BELOW that threshold", value=0) min_intensity_DAPI
 #@ Boolean(label="Filter objects touching in Z", description="Discard objects touching in the first and last slice", value=False) filter_objects_touching_z
+#@ Boolean(label="Profile the pipeline", description="Save the time and memory used by each step as a trace and a summary table", value=False) do_profile
 
 # ─── IMPORTS ────────────────────────────────────────────────────────────────────
 
 import os
+import csv
+import json
+import time
 
 from ij import IJ, ImagePlus
 from ij.plugin import Duplicator, ImageCalculator
@@ -49,6 +53,10 @@ from inra.ijpb.morphology import Morphology
 from loci.plugins import BF
 from loci.plugins.in import ImporterOptions
 
+# Profiling imports
+from java.lang import System, Thread
+from java.lang.management import ManagementFactory, MemoryType
+
 # ─── FUNCTIONS ──────────────────────────────────────────────────────────────────
 
 def checkForFiles(filepath):
@@ -91,6 +99,163 @@ def BFImport(indivFile):
     imps = BF.openImagePlus(options)
     return imps
 
+def getProcessCpuTime():
+    """Get the CPU time used so far by the JVM
+
+    Uses the CPU time of the whole process so that multithreaded filters
+    are accounted for, and falls back to the current thread otherwise.
+
+    Returns:
+        long -- CPU time in nanoseconds
+    """
+    if process_cpu_available:
+        return os_bean.getProcessCpuTime()
+    return ManagementFactory.getThreadMXBean().getCurrentThreadCpuTime()
+
+def getResidentMemory():
+    """Read the current and peak resident set size of the JVM
+
+    Only available on Linux through /proc.
+
+    Returns:
+        tuple -- Current and peak RSS in bytes, (None, None) if not available
+    """
+    rss = rss_peak = None
+    if not os.path.exists("/proc/self/status"):
+        return rss, rss_peak
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1]) * 1024
+            elif line.startswith("VmHWM:"):
+                rss_peak = int(line.split()[1]) * 1024
+    return rss, rss_peak
+
+def getVoxelCount(implus):
+    """Get the number of voxels in all the planes of an image
+
+    Arguments:
+        implus {imagePlus} -- ImagePlus to count the voxels of
+
+    Returns:
+        long -- Number of voxels
+    """
+    return long(implus.getWidth()) * implus.getHeight() * implus.getStackSize()
+
+def startStage(name, **args):
+    """Start recording a stage of the pipeline
+
+    Does nothing if profiling is off. Stages are not meant to be nested
+    as the heap peak usage is reset at every start.
+
+    Arguments:
+        name {str} -- Name of the stage, used to group them in the summary
+        args       -- Extra information to store with the stage (file, ROI...)
+
+    Returns:
+        dict -- Stage being recorded, None if profiling is off
+    """
+    if not do_profile:
+        return None
+    for pool in heap_pools:
+        pool.resetPeakUsage()
+    return {"name": name, "args": args,
+            "wall": System.nanoTime(), "cpu": getProcessCpuTime()}
+
+def endStage(stage, implus=None, objects=None):
+    """Stop recording a stage and store it as a trace event
+
+    Arguments:
+        stage {dict} -- Stage returned by startStage
+
+    Keyword Arguments:
+        implus {imagePlus or list} -- Images made or processed in the stage, for the voxel count (default: {None})
+        objects {int}              -- Number of spots or objects found in the stage (default: {None})
+    """
+    if stage is None:
+        return
+    wall = System.nanoTime() - stage["wall"]
+    cpu  = getProcessCpuTime() - stage["cpu"]
+    rss, rss_peak = getResidentMemory()
+
+    args = stage["args"]
+    args["cpu_ms"]    = cpu / 1e6
+    # Each pool peaks at its own time, so this sum is an upper bound of the heap peak
+    args["heap_peak"] = sum([pool.getPeakUsage().getUsed() for pool in heap_pools])
+    args["rss"]       = rss
+    args["rss_peak"]  = rss_peak
+    if isinstance(implus, list):
+        args["voxels"] = sum([getVoxelCount(x) for x in implus])
+    else:
+        args["voxels"] = getVoxelCount(implus) if implus is not None else None
+    args["objects"]   = objects
+
+    # Complete event of the Chrome trace format, times in microseconds
+    profile_events.append({
+        "name": stage["name"],
+        "cat" : "pipeline",
+        "ph"  : "X",
+        "pid" : 1,
+        "tid" : Thread.currentThread().getId(),
+        "ts"  : (stage["wall"] - profile_origin) / 1e3,
+        "dur" : wall / 1e3,
+        "args": args})
+
+def writeProfile(out_dir, run_name):
+    """Save the recorded stages as a Chrome trace and a summary table
+
+    The trace can be opened in chrome://tracing or https://ui.perfetto.dev,
+    the summary is saved as a CSV and printed in the log window.
+
+    Arguments:
+        out_dir {str}  -- Folder where to save the files
+        run_name {str} -- Prefix for the files names
+    """
+    if not profile_events:
+        return
+
+    trace_path = os.path.join(out_dir, run_name + "_trace.json")
+    with open(trace_path, "w") as f:
+        json.dump({"traceEvents": profile_events, "displayTimeUnit": "ms"}, f)
+
+    # Aggregate the stages by name, keeping the order of first appearance
+    names   = []
+    summary = {}
+    for event in profile_events:
+        name = event["name"]
+        args = event["args"]
+        if name not in summary:
+            names.append(name)
+            summary[name] = [0, 0.0, 0.0, 0, 0, 0, 0]
+        row = summary[name]
+        row[0] += 1
+        row[1] += event["dur"] / 1e6
+        row[2] += args["cpu_ms"] / 1e3
+        row[3]  = max(row[3], args["heap_peak"])
+        row[4]  = max(row[4], args["rss_peak"] or 0)
+        row[5] += args["voxels"] or 0
+        row[6] += args["objects"] or 0
+
+    header = ["Stage", "Calls", "Wall time (s)", "CPU time (s)",
+              "Heap peak, sum of pools (MB)", "RSS peak (MB)", "Voxels", "Objects"]
+    rows = []
+    for name in names:
+        calls, wall, cpu, heap_peak, rss_peak, voxels, objects = summary[name]
+        rows.append([name, calls, round(wall, 3), round(cpu, 3),
+                     round(heap_peak / 1048576.0, 1), round(rss_peak / 1048576.0, 1),
+                     voxels, objects])
+
+    summary_path = os.path.join(out_dir, run_name + "_summary.csv")
+    with open(summary_path, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+    IJ.log("Profiling summary, trace saved in " + trace_path)
+    IJ.log("\t".join(header))
+    for row in rows:
+        IJ.log("\t".join([str(x) for x in row]))
+
 
 # ─── MAIN CODE ──────────────────────────────────────────────────────────────────
 
@@ -103,160 +268,201 @@ IJ.log("STARTING")
 src_dir = str(src_dir)
 files = getFileList(src_dir, filename_filter)
 
+# Profiling setup, only the start and end of each stage are timed
+profile_events = []
+profile_origin = System.nanoTime()
+heap_pools     = [pool for pool in ManagementFactory.getMemoryPoolMXBeans()
+                  if pool.getType() == MemoryType.HEAP]
+os_bean        = ManagementFactory.getOperatingSystemMXBean()
+try:
+    os_bean.getProcessCpuTime()
+    process_cpu_available = True
+except Exception:
+    process_cpu_available = False
+
 # If the list of files is not empty
 if files:
 
     # For each file finishing with the filtered string
-    for file in files:
-        # Get info for the files
-        folder   = os.path.dirname(file)
-        basename = os.path.basename(file)
-        basename = os.path.splitext(basename)[0]
-
-        # Import the file with BioFormats
-        IJ.log("Currently opening " + basename + "...")
-        imps = BFImport(str(file))
-
-        for imp in imps:
-
-            # Get info about the image
-            input_dir = imp.getOriginalFileInfo().directory
-            filename  = os.path.splitext(imp.getOriginalFileInfo().fileName)[0]
-            filename  = filename.replace(" ", "_")
-
-            out_folder = os.path.join(input_dir,filename)
-            if not os.path.exists(out_folder):
-                os.makedirs(out_folder)
-
-            # Still open the image for testing H-watershed
-            # TODO: Remove it when settings are decided
-            channel_of_interest = 1
-            imp_for_tm1 = Duplicator().run(imp, channel_of_interest,
-                                        channel_of_interest, 1, imp.getNSlices(), 1, 1)
-            channel_of_interest = 2
-            imp_for_tm2 = Duplicator().run(imp, channel_of_interest,
-                                        channel_of_interest, 1, imp.getNSlices(), 1, 1)
-
-
-            IJ.log("    Looking into Channel 3")
-            channel_of_interest = 3
-            imp_for_tm3 = Duplicator().run(imp, channel_of_interest,
-                                        channel_of_interest, 1, imp.getNSlices(), 1, 1)
-            imp_for_bgd = Duplicator().run(imp, channel_of_interest,
-                                        channel_of_interest, 1, imp.getNSlices(), 1, 1)
-
-
-            # Background subtraction
-            IJ.log("    Pre processing")
-            ic = ImageCalculator()
-            IJ.log("        Gaussian")
-            IJ.run(imp_for_bgd, "Gaussian Blur...", "sigma=20 stack")
-            IJ.log("        Background subtraction")
-            imp_minus_bgd = ic.run("Subtract create stack", imp_for_tm3, imp_for_bgd)
-            IJ.log("        Median filter")
-            IJ.run(imp_minus_bgd, "Median 3D...", "x=6 y=6 z=2")
-            # imp_for_tm1.show()
-            # imp_for_tm2.show()
-            # imp_for_tm3.show()
-            # imp_minus_bgd.show()
-            # IJ.run("Interactive H_Watershed")
-            # IJ.selectWindow("interactive watershed-Z");
-
-            # ─── H WATERSHED ────────────────────────────────────────────────────────────────
-            IJ.log("    H-watershed")
-            h_value                = 50
-            segmentation_threshold = 4
-            peakFlooding           = 86
-            outputMask             = True # necessary so it can be used by ops connected component to create an ImgLabeling
-            allowSplit             = True
-
-
-            all_nuclei_mask = ops.run("H_Watershed", imp_minus_bgd, h_value, segmentation_threshold, peakFlooding, outputMask, allowSplit)
-
-            all_nuclei_mask.setTitle("All nuclei mask")
-            # all_nuclei_mask.show()
-
-            # ─── 3D ROI MANAGER ─────────────────────────────────────────────────────────────
-            IJ.log("    Dilation")
-            # Segment the image for 3D Manager
-            segment_3D  = Segment3DImage(all_nuclei_mask, 1, 255)
-            segment_3D.segment()
-            stack_label = segment_3D.getLabelledObjectsStack()
-            imp_label   = ImagePlus("3D Labelled", stack_label)
-            imp_label.setCalibration(imp.getCalibration())
-
-            # Filter with Morphological opening to get rif of the rings
-            # create structuring element (ball of x,y,z-radius in px)
-            strel = Strel3D.Shape.BALL.fromRadiusList(2, 2, 2)
-
-            # apply morphological opening filter to input image
-
-            imStWTH = Morphology.dilation(imp_label.getImageStack(), strel)
-
-            impWTH  = ImagePlus("WTH results", imStWTH)
-            # assign correct calibration
-            impWTH.setCalibration(imp.getCalibration())
-            # impWTH.show()
-
-
-
-            # wrap ImagePlus into 3D suite image format
-            img           = ImageInt.wrap(impWTH)
-            # create a population of 3D objects
-            pop           = Objects3DPopulation(img)
-            unit          = imp.getCalibration().getUnits()
-            # print(nb)
-            IH_imp_C1     = ImageHandler.wrap(imp_for_tm1)
-            IH_imp_C2     = ImageHandler.wrap(imp_for_tm2)
-            IH_imp_C3     = ImageHandler.wrap(imp_for_tm3)
-            volList       = []
-            meanIntList   = []
-            feretList     = []
-
-            obj_to_remove = []
-
-            IJ.log("    Saving raw objects")
-            raw_objects_path = os.path.join(out_folder, filename + "_raw_objects.zip")
-            pop.removeObjectsTouchingBorders(img, filter_objects_touching_z)
-            nb            = pop.getNbObjects()
-            pop.saveObjects(raw_objects_path)
-
-            IJ.log("    Filtering")
-            # loop over the objects
-            for i in range(0, nb):
-                obj = pop.getObject(i)
-                # if(obj.touchBorders(img, filter_objects_touching_z)):
-                #     obj_to_remove.append(obj)
-                #     continue
-                if(obj.getVolumeUnit() < min_volume):
-                    obj_to_remove.append(obj)
-                    continue
-                if(obj.getPixMeanValue(IH_imp_C1) < min_intensity_DAPI):
-                    obj_to_remove.append(obj)
-                    continue
-
-
-                volList.append(obj.getVolumeUnit())
-                # print(obj.getIntegratedDensity())
-
-                # Measure volume unit
-                # print(obj.getMeasure(2))
-
-                # Measure mean intensity
-                meanIntList.append(obj.getPixMeanValue(IH_imp_C2))
-
-
-            IJ.log("    Saving removed objects")
-            removed_objects_path = os.path.join(out_folder, filename + "_removed_objects.zip")
-            pop_3D_removed = Objects3DPopulation(obj_to_remove)
-            pop_3D_removed.saveObjects(removed_objects_path)
-
-            for obj in obj_to_remove:
-                pop.removeObject(obj)
-
-            IJ.log("    Saving filtered objects")
-            filtered_objects_path = os.path.join(out_folder, filename + "_filtered_objects.zip")
-            pop.saveObjects(filtered_objects_path)
-
-        IJ.log("DONE")
+    # Save the profiling even if an image fails so that the batch can be checked
+    try:
+        for file in files:
+            # Get info for the files
+            folder   = os.path.dirname(file)
+            basename = os.path.basename(file)
+            basename = os.path.splitext(basename)[0]
+
+            # Import the file with BioFormats
+            IJ.log("Currently opening " + basename + "...")
+            stage = startStage("load", file=basename)
+            imps = BFImport(str(file))
+            endStage(stage, imps[0] if imps else None)
+
+            for imp in imps:
+
+                # Get info about the image
+                input_dir = imp.getOriginalFileInfo().directory
+                filename  = os.path.splitext(imp.getOriginalFileInfo().fileName)[0]
+                filename  = filename.replace(" ", "_")
+
+                out_folder = os.path.join(input_dir,filename)
+                if not os.path.exists(out_folder):
+                    os.makedirs(out_folder)
+
+                # Still open the image for testing H-watershed
+                # TODO: Remove it when settings are decided
+                stage = startStage("duplicate", file=basename)
+                channel_of_interest = 1
+                imp_for_tm1 = Duplicator().run(imp, channel_of_interest,
+                                            channel_of_interest, 1, imp.getNSlices(), 1, 1)
+                channel_of_interest = 2
+                imp_for_tm2 = Duplicator().run(imp, channel_of_interest,
+                                            channel_of_interest, 1, imp.getNSlices(), 1, 1)
+
+
+                IJ.log("    Looking into Channel 3")
+                channel_of_interest = 3
+                imp_for_tm3 = Duplicator().run(imp, channel_of_interest,
+                                            channel_of_interest, 1, imp.getNSlices(), 1, 1)
+                imp_for_bgd = Duplicator().run(imp, channel_of_interest,
+                                            channel_of_interest, 1, imp.getNSlices(), 1, 1)
+                endStage(stage, [imp_for_tm1, imp_for_tm2, imp_for_tm3, imp_for_bgd])
+
+
+                # Background subtraction
+                IJ.log("    Pre processing")
+                stage = startStage("background", file=basename)
+                ic = ImageCalculator()
+                IJ.log("        Gaussian")
+                IJ.run(imp_for_bgd, "Gaussian Blur...", "sigma=20 stack")
+                IJ.log("        Background subtraction")
+                imp_minus_bgd = ic.run("Subtract create stack", imp_for_tm3, imp_for_bgd)
+                endStage(stage, imp_minus_bgd)
+                IJ.log("        Median filter")
+                stage = startStage("median", file=basename)
+                IJ.run(imp_minus_bgd, "Median 3D...", "x=6 y=6 z=2")
+                endStage(stage, imp_minus_bgd)
+                # imp_for_tm1.show()
+                # imp_for_tm2.show()
+                # imp_for_tm3.show()
+                # imp_minus_bgd.show()
+                # IJ.run("Interactive H_Watershed")
+                # IJ.selectWindow("interactive watershed-Z");
+
+                # ─── H WATERSHED ────────────────────────────────────────────────────────────────
+                IJ.log("    H-watershed")
+                h_value                = 50
+                segmentation_threshold = 4
+                peakFlooding           = 86
+                outputMask             = True # necessary so it can be used by ops connected component to create an ImgLabeling
+                allowSplit             = True
+
+
+                stage = startStage("watershed", file=basename)
+                all_nuclei_mask = ops.run("H_Watershed", imp_minus_bgd, h_value, segmentation_threshold, peakFlooding, outputMask, allowSplit)
+                endStage(stage, all_nuclei_mask)
+
+                all_nuclei_mask.setTitle("All nuclei mask")
+                # all_nuclei_mask.show()
+
+                # ─── 3D ROI MANAGER ─────────────────────────────────────────────────────────────
+                IJ.log("    Dilation")
+                # Segment the image for 3D Manager
+                stage = startStage("segmentation", file=basename)
+                segment_3D  = Segment3DImage(all_nuclei_mask, 1, 255)
+                segment_3D.segment()
+                stack_label = segment_3D.getLabelledObjectsStack()
+                imp_label   = ImagePlus("3D Labelled", stack_label)
+                imp_label.setCalibration(imp.getCalibration())
+                endStage(stage, imp_label)
+
+                # Filter with Morphological opening to get rif of the rings
+                # create structuring element (ball of x,y,z-radius in px)
+                stage = startStage("dilation", file=basename)
+                strel = Strel3D.Shape.BALL.fromRadiusList(2, 2, 2)
+
+                # apply morphological opening filter to input image
+
+                imStWTH = Morphology.dilation(imp_label.getImageStack(), strel)
+
+                impWTH  = ImagePlus("WTH results", imStWTH)
+                # assign correct calibration
+                impWTH.setCalibration(imp.getCalibration())
+                endStage(stage, impWTH)
+                # impWTH.show()
+
+
+
+                stage = startStage("measurement", file=basename)
+                # wrap ImagePlus into 3D suite image format
+                img           = ImageInt.wrap(impWTH)
+                # create a population of 3D objects
+                pop           = Objects3DPopulation(img)
+                unit          = imp.getCalibration().getUnits()
+                # print(nb)
+                IH_imp_C1     = ImageHandler.wrap(imp_for_tm1)
+                IH_imp_C2     = ImageHandler.wrap(imp_for_tm2)
+                IH_imp_C3     = ImageHandler.wrap(imp_for_tm3)
+                volList       = []
+                meanIntList   = []
+                feretList     = []
+
+                obj_to_remove = []
+
+                pop.removeObjectsTouchingBorders(img, filter_objects_touching_z)
+                nb            = pop.getNbObjects()
+                endStage(stage, impWTH)
+
+                IJ.log("    Saving raw objects")
+                stage = startStage("save", file=basename)
+                raw_objects_path = os.path.join(out_folder, filename + "_raw_objects.zip")
+                pop.saveObjects(raw_objects_path)
+                endStage(stage)
+
+                IJ.log("    Filtering")
+                stage = startStage("measurement", file=basename)
+                # loop over the objects
+                for i in range(0, nb):
+                    obj = pop.getObject(i)
+                    # if(obj.touchBorders(img, filter_objects_touching_z)):
+                    #     obj_to_remove.append(obj)
+                    #     continue
+                    if(obj.getVolumeUnit() < min_volume):
+                        obj_to_remove.append(obj)
+                        continue
+                    if(obj.getPixMeanValue(IH_imp_C1) < min_intensity_DAPI):
+                        obj_to_remove.append(obj)
+                        continue
+
+
+                    volList.append(obj.getVolumeUnit())
+                    # print(obj.getIntegratedDensity())
+
+                    # Measure volume unit
+                    # print(obj.getMeasure(2))
+
+                    # Measure mean intensity
+                    meanIntList.append(obj.getPixMeanValue(IH_imp_C2))
+
+
+                endStage(stage, objects=len(volList))
+
+                IJ.log("    Saving removed objects")
+                stage = startStage("save", file=basename)
+                removed_objects_path = os.path.join(out_folder, filename + "_removed_objects.zip")
+                pop_3D_removed = Objects3DPopulation(obj_to_remove)
+                pop_3D_removed.saveObjects(removed_objects_path)
+
+                for obj in obj_to_remove:
+                    pop.removeObject(obj)
+
+                IJ.log("    Saving filtered objects")
+                filtered_objects_path = os.path.join(out_folder, filename + "_filtered_objects.zip")
+                pop.saveObjects(filtered_objects_path)
+                endStage(stage, objects=pop.getNbObjects())
+
+            IJ.log("DONE")
+    finally:
+        if do_profile:
+            writeProfile(src_dir, "H_watershed_3D_nuclei_" + time.strftime("%Y%m%d_%H%M%S"))
             # outCSV = outFullPath + ".csv"
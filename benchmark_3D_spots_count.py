@@ -0,0 +1,887 @@
+'''
+Group: IMCF
+Creation Date: Monday, 19th October 2026 10:12:40 am
+-----
+Benchmark of count_3D_FISH.py and H_watershed_3D_nuclei.py on synthetic
+phantoms. Calibrated 4 channels stacks are generated with Gaussian spots and
+ellipsoidal nuclei at known positions, a background gradient and noise, along
+with the matching ROI zips. Both pipelines are then run on them through the
+ScriptService with the profiling on, and the speed, memory and accuracy
+against the ground truth are saved as JSON and CSV.
+'''
+
+# ─── SCRIPT PARAMETERS ──────────────────────────────────────────────────────────
+
+#@ ScriptService scripts
+
+#@ File(label="Select the directory with the analysis scripts", style="directory") scripts_dir
+#@ File(label="Select the directory where to save the phantoms and results", style="directory") out_dir
+#@ String(label="Label of the version being benchmarked", value="dev") version_label
+#@ String(label="Pipelines to benchmark", choices={"both", "count_3D_FISH", "H_watershed_3D_nuclei"}, value="both") pipelines
+#@ String(label="Stack sizes", description="Comma separated list of XxYxZ sizes in pixels", value="256x256x16,512x512x32") stack_sizes
+#@ String(label="Number of ROIs", description="Comma separated list, used for count_3D_FISH", value="1,4") roi_counts
+#@ String(label="Spot densities", description="Comma separated list of spots per um2, used for count_3D_FISH", value="0.02,0.1") spot_densities
+#@ String(label="Number of nuclei", description="Comma separated list, used for H_watershed_3D_nuclei", value="5,15") nuclei_counts
+#@ Integer(label="Images per case", value=2) images_per_case
+#@ Integer(label="Random seed", value=42) seed
+#@ Boolean(label="Only generate the phantoms", value=False) generate_only
+#@ String(label="Previous results to compare to", description="JSON file from a previous benchmark, leave empty to skip", value="") reference_results
+
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+
+import os
+import csv
+import glob
+import json
+import math
+import time
+
+from ij import IJ, ImagePlus, ImageStack
+from ij.gui import OvalRoi
+from ij.measure import Calibration
+from ij.plugin import RGBStackMerge
+from ij.plugin.frame import RoiManager
+from ij.process import ByteProcessor, FloatProcessor, ImageConverter, ImageProcessor
+
+# 3DSuite imports
+from mcib3d.geom import Objects3DPopulation
+
+from java.io import File
+from java.lang import Runtime, String, System
+from java.util import HashMap, Random
+
+
+# ─── VARIABLES ──────────────────────────────────────────────────────────────────
+
+# ###################### #
+# PHANTOM SETTINGS       #
+# ###################### #
+
+# Calibration of the phantoms in microns
+pixel_width   = 0.1
+pixel_depth   = 0.3
+# Spot radius for channels 2, 3 and 4, same as in count_3D_FISH.py
+spot_radii    = {2: 0.425, 3: 0.45, 4: 0.425}
+# Peak intensity of the spots above background
+spot_intensity = 600
+# Range of the nuclei semi-axes in microns, XY then Z
+nucleus_xy    = (1.5, 2.5)
+nucleus_z     = (1.2, 2.0)
+# Intensity of the nuclei above background
+nucleus_intensity = 1000
+# Background level, relative change across XY and attenuation in Z
+background    = 100
+gradient_xy   = 0.5
+attenuation_z = 0.3
+# Standard deviation of the Gaussian noise
+noise_sd      = 15
+
+# Number of channels in the phantoms
+n_channels    = 4
+
+# Background content of the phantoms when the matching list is left empty,
+# nuclei in the count_3D_FISH phantoms and spots in the nuclei ones
+default_nuclei  = 5
+default_density = 0.02
+
+# Input values for H_watershed_3D_nuclei.py
+min_volume         = 0
+min_intensity_DAPI = 0
+
+
+# ─── FUNCTIONS ──────────────────────────────────────────────────────────────────
+
+
+def parseList(text, cast):
+    """Split a comma separated list from the dialog
+
+    Arguments:
+        text {str}      -- Text to split
+        cast {function} -- Function used to convert each item
+
+    Returns:
+        list -- List of converted items
+    """
+    return [cast(item.strip()) for item in text.split(",") if item.strip()]
+
+def parseSize(text):
+    """Convert a XxYxZ size into a tuple of ints
+
+    Arguments:
+        text {str} -- Size of the stack, for example 256x256x16
+
+    Returns:
+        tuple -- Width, height and depth
+    """
+    return tuple([int(x) for x in text.lower().split("x")])
+
+def getCaseRandom(case_name):
+    """Get a random generator seeded from the seed and the case name
+
+    This way a case gets the same phantoms no matter which other cases are run.
+
+    Arguments:
+        case_name {str} -- Name of the case
+
+    Returns:
+        Random -- Seeded random generator
+    """
+    return Random(seed * 1000003 + String(case_name).hashCode())
+
+def uniform(rnd, low, high):
+    """Draw a float uniformly between two values
+
+    Arguments:
+        rnd {Random}  -- Random generator to use
+        low {float}   -- Lower bound
+        high {float}  -- Upper bound
+
+    Returns:
+        float -- Random value
+    """
+    return low + (high - low) * rnd.nextDouble()
+
+def createChannel(width, height, depth):
+    """Create an empty 32-bit stack and get direct access to its planes
+
+    Arguments:
+        width {int}  -- Width of the stack
+        height {int} -- Height of the stack
+        depth {int}  -- Number of slices
+
+    Returns:
+        tuple -- ImagePlus of the channel and the list of its float arrays
+    """
+    stack = ImageStack(width, height)
+    for k in range(depth):
+        stack.addSlice(FloatProcessor(width, height))
+    pixels = [stack.getPixels(k + 1) for k in range(depth)]
+    return ImagePlus("channel", stack), pixels
+
+def addGaussianSpot(pixels, width, height, x, y, z, sigma_xy, sigma_z, amplitude):
+    """Add a 3D Gaussian spot to a stack, only computed within 3 sigmas
+
+    Arguments:
+        pixels {list}     -- Float arrays of the planes
+        width {int}       -- Width of the stack
+        height {int}      -- Height of the stack
+        x {float}         -- Center of the spot in pixels
+        y {float}         -- Center of the spot in pixels
+        z {float}         -- Center of the spot in slices
+        sigma_xy {float}  -- Standard deviation in pixels
+        sigma_z {float}   -- Standard deviation in slices
+        amplitude {float} -- Peak intensity of the spot
+    """
+    r_xy = int(math.ceil(3 * sigma_xy))
+    r_z  = int(math.ceil(3 * sigma_z))
+    x0, x1 = max(0, int(x) - r_xy), min(width - 1, int(x) + r_xy + 1)
+    y0, y1 = max(0, int(y) - r_xy), min(height - 1, int(y) + r_xy + 1)
+    z0, z1 = max(0, int(z) - r_z), min(len(pixels) - 1, int(z) + r_z + 1)
+
+    g_x = [math.exp(-0.5 * ((i - x) / sigma_xy) ** 2) for i in range(x0, x1 + 1)]
+    for k in range(z0, z1 + 1):
+        g_z   = amplitude * math.exp(-0.5 * ((k - z) / sigma_z) ** 2)
+        plane = pixels[k]
+        for j in range(y0, y1 + 1):
+            g_yz   = g_z * math.exp(-0.5 * ((j - y) / sigma_xy) ** 2)
+            offset = j * width + x0
+            for i in range(len(g_x)):
+                plane[offset + i] += g_yz * g_x[i]
+
+def addEllipsoid(pixels, width, height, cx, cy, cz, ax, ay, az, value):
+    """Fill an axis aligned ellipsoid in a stack
+
+    Arguments:
+        pixels {list}  -- Float arrays of the planes
+        width {int}    -- Width of the stack
+        height {int}   -- Height of the stack
+        cx {float}     -- Center of the ellipsoid in pixels
+        cy {float}     -- Center of the ellipsoid in pixels
+        cz {float}     -- Center of the ellipsoid in slices
+        ax {float}     -- Semi-axis in X in pixels
+        ay {float}     -- Semi-axis in Y in pixels
+        az {float}     -- Semi-axis in Z in slices
+        value {float}  -- Intensity inside the ellipsoid
+
+    Returns:
+        int -- Number of voxels filled
+    """
+    count = 0
+    for k in range(max(0, int(math.ceil(cz - az))), min(len(pixels) - 1, int(cz + az)) + 1):
+        d_z   = ((k - cz) / az) ** 2
+        plane = pixels[k]
+        for j in range(max(0, int(math.ceil(cy - ay))), min(height - 1, int(cy + ay)) + 1):
+            d_yz = d_z + ((j - cy) / ay) ** 2
+            if d_yz > 1:
+                continue
+            half = ax * math.sqrt(1 - d_yz)
+            i0   = max(0, int(math.ceil(cx - half)))
+            i1   = min(width - 1, int(math.floor(cx + half)))
+            for i in range(i0, i1 + 1):
+                plane[j * width + i] = value
+            count += max(0, i1 - i0 + 1)
+    return count
+
+def placeNuclei(rnd, width, height, depth, n_nuclei):
+    """Draw non overlapping nuclei that stay away from the borders
+
+    Arguments:
+        rnd {Random}    -- Random generator to use
+        width {int}     -- Width of the stack
+        height {int}    -- Height of the stack
+        depth {int}     -- Number of slices
+        n_nuclei {int}  -- Number of nuclei wanted
+
+    Returns:
+        list -- Center and semi-axes of the nuclei in pixels, may be shorter
+                than asked if the stack is too crowded
+    """
+    nuclei = []
+    for attempt in range(1000 * max(1, n_nuclei)):
+        if len(nuclei) == n_nuclei:
+            break
+        ax = uniform(rnd, nucleus_xy[0], nucleus_xy[1]) / pixel_width
+        ay = uniform(rnd, nucleus_xy[0], nucleus_xy[1]) / pixel_width
+        az = uniform(rnd, nucleus_z[0], nucleus_z[1]) / pixel_depth
+        # Margin for the blur and the dilation in H_watershed_3D_nuclei.py
+        margin_xy = max(ax, ay) + 4
+        margin_z  = az + 1
+        if width <= 2 * margin_xy or height <= 2 * margin_xy or depth <= 2 * margin_z:
+            continue
+        cx = uniform(rnd, margin_xy, width - margin_xy)
+        cy = uniform(rnd, margin_xy, height - margin_xy)
+        cz = uniform(rnd, margin_z, depth - margin_z)
+        # Keep nuclei apart in XY so that they can be separated
+        overlapping = False
+        for other in nuclei:
+            distance = math.hypot(cx - other["center"][0], cy - other["center"][1])
+            if distance < 1.2 * (max(ax, ay) + max(other["axes"][0], other["axes"][1])):
+                overlapping = True
+                break
+        if not overlapping:
+            nuclei.append({"center": [cx, cy, cz], "axes": [ax, ay, az]})
+    return nuclei
+
+def placeSpots(rnd, width, height, depth, density, radius):
+    """Draw well separated spots at a given density
+
+    Arguments:
+        rnd {Random}     -- Random generator to use
+        width {int}      -- Width of the stack
+        height {int}     -- Height of the stack
+        depth {int}      -- Number of slices
+        density {float}  -- Number of spots per um2
+        radius {float}   -- Radius of the spots in microns
+
+    Returns:
+        list -- Positions of the spots in pixels and slices
+    """
+    n_spots  = int(round(density * width * height * pixel_width * pixel_width))
+    sigma    = radius / math.sqrt(3)
+    margin_z = 2 * sigma / pixel_depth
+    spots    = []
+    for attempt in range(50 * max(1, n_spots)):
+        if len(spots) == n_spots or depth <= 2 * margin_z:
+            break
+        x = uniform(rnd, 0, width - 1)
+        y = uniform(rnd, 0, height - 1)
+        z = uniform(rnd, margin_z, depth - 1 - margin_z)
+        too_close = False
+        for other in spots:
+            distance = math.sqrt(((x - other[0]) * pixel_width) ** 2 +
+                                 ((y - other[1]) * pixel_width) ** 2 +
+                                 ((z - other[2]) * pixel_depth) ** 2)
+            if distance < 6 * sigma:
+                too_close = True
+                break
+        if not too_close:
+            spots.append([x, y, z])
+    return spots
+
+def createROIs(width, height, n_rois):
+    """Create oval ROIs on a regular grid covering the image
+
+    Arguments:
+        width {int}   -- Width of the image
+        height {int}  -- Height of the image
+        n_rois {int}  -- Number of ROIs
+
+    Returns:
+        list -- List of OvalRoi
+    """
+    cols = int(math.ceil(math.sqrt(n_rois)))
+    rows = int(math.ceil(float(n_rois) / cols))
+    cell_w = width / cols
+    cell_h = height / rows
+    rois = []
+    for index in range(n_rois):
+        x = (index % cols) * cell_w
+        y = (index / cols) * cell_h
+        rois.append(OvalRoi(x + cell_w / 10, y + cell_h / 10,
+                            cell_w * 8 / 10, cell_h * 8 / 10))
+    return rois
+
+def finishChannel(imp_channel, rnd, blur):
+    """Add the background and noise to a channel and convert it to 16-bit
+
+    Arguments:
+        imp_channel {imagePlus} -- 32-bit channel with the objects drawn
+        rnd {Random}            -- Random generator used to seed the noise
+        blur {bool}             -- Smooth the objects before adding the noise
+    """
+    depth = imp_channel.getNSlices()
+    if blur:
+        IJ.run(imp_channel, "Gaussian Blur 3D...", "x=1 y=1 z=0.5")
+    # Uneven illumination in XY and loss of signal deeper in the sample
+    IJ.run(imp_channel, "Macro...",
+           "code=[v=v+%f*(1+%f*(x/w+y/h-1)-%f*z/%d)] stack" %
+           (background, gradient_xy, attenuation_z, depth))
+    ImageProcessor.setRandomSeed(rnd.nextInt())
+    IJ.run(imp_channel, "Add Specified Noise...", "stack standard=%f" % noise_sd)
+    # Keep the intensities as they are so that the thresholds of the scripts apply
+    do_scaling = ImageConverter.getDoScaling()
+    ImageConverter.setDoScaling(False)
+    ImageConverter(imp_channel).convertToGray16()
+    ImageConverter.setDoScaling(do_scaling)
+
+def generatePhantom(path, kind, size, n_rois, density, n_nuclei, rnd):
+    """Generate a synthetic 4 channels stack with its ROIs and ground truth
+
+    For the "fish" kind, channel 1 has the nuclei and channels 2 to 4 have
+    spots. For the "nuclei" kind, channels 1 to 3 have the nuclei, with a
+    different intensity per nucleus in channel 2, and channel 4 has spots.
+
+    Arguments:
+        path {str}       -- Path of the TIF to create, without extension
+        kind {str}       -- Either "fish" or "nuclei"
+        size {tuple}     -- Width, height and depth of the stack
+        n_rois {int}     -- Number of ROIs to save in the zip
+        density {float}  -- Number of spots per um2
+        n_nuclei {int}   -- Number of nuclei
+        rnd {Random}     -- Random generator to use
+
+    Returns:
+        dict -- Ground truth of the phantom
+    """
+    width, height, depth = size
+    rois   = createROIs(width, height, n_rois)
+    nuclei = placeNuclei(rnd, width, height, depth, n_nuclei)
+    voxel_volume = pixel_width * pixel_width * pixel_depth
+
+    if kind == "fish":
+        nuclei_channels = {1: [nucleus_intensity] * len(nuclei)}
+        spot_channels   = [2, 3, 4]
+    else:
+        nuclei_channels = {1: [nucleus_intensity] * len(nuclei),
+                           2: [uniform(rnd, 200, 1000) for nucleus in nuclei],
+                           3: [nucleus_intensity] * len(nuclei)}
+        spot_channels   = [4]
+
+    channels = []
+    spots    = {}
+    for channel in range(1, n_channels + 1):
+        imp_channel, pixels = createChannel(width, height, depth)
+        if channel in nuclei_channels:
+            for nucleus, value in zip(nuclei, nuclei_channels[channel]):
+                cx, cy, cz = nucleus["center"]
+                ax, ay, az = nucleus["axes"]
+                voxels = addEllipsoid(pixels, width, height,
+                                      cx, cy, cz, ax, ay, az, value)
+                nucleus["volume"] = voxels * voxel_volume
+        if channel in spot_channels:
+            radius   = spot_radii[channel]
+            sigma_xy = radius / math.sqrt(3) / pixel_width
+            sigma_z  = radius / math.sqrt(3) / pixel_depth
+            spots[channel] = placeSpots(rnd, width, height, depth, density, radius)
+            for x, y, z in spots[channel]:
+                addGaussianSpot(pixels, width, height, x, y, z,
+                                sigma_xy, sigma_z, spot_intensity)
+        finishChannel(imp_channel, rnd, channel in nuclei_channels)
+        channels.append(imp_channel)
+
+    imp = RGBStackMerge.mergeChannels(channels, False)
+    cal = Calibration()
+    cal.pixelWidth  = pixel_width
+    cal.pixelHeight = pixel_width
+    cal.pixelDepth  = pixel_depth
+    cal.setUnit("micron")
+    imp.setCalibration(cal)
+    IJ.saveAsTiff(imp, path + ".tif")
+    imp.close()
+
+    rm = RoiManager(False)
+    for roi in rois:
+        rm.addRoi(roi)
+    rm.runCommand("Save", path + ".zip")
+    rm.close()
+
+    # Spots counted per ROI as count_3D_FISH.py does, areas in um2
+    roi_truth = []
+    for roi in rois:
+        mask = ByteProcessor(width, height)
+        mask.setRoi(roi)
+        roi_spots = {}
+        for channel in spot_channels:
+            roi_spots[str(channel)] = [spot for spot in spots[channel]
+                                       if roi.contains(int(round(spot[0])), int(round(spot[1])))]
+        roi_truth.append({
+            "area" : mask.getStatistics().pixelCount * pixel_width * pixel_width,
+            "spots": roi_spots})
+
+    truth = {
+        "kind"       : kind,
+        "size"       : list(size),
+        "calibration": [pixel_width, pixel_width, pixel_depth],
+        "rois"       : roi_truth,
+        "spots"      : dict([(str(c), s) for c, s in spots.items()]),
+        "nuclei"     : nuclei}
+    with open(path + "_ground_truth.json", "w") as f:
+        json.dump(truth, f)
+    return truth
+
+def matchPairs(distances, tolerance):
+    """Greedily match detections to ground truth, closest pairs first
+
+    Arguments:
+        distances {list}  -- Tuples of (distance, truth index, detection index)
+        tolerance {float} -- Maximum distance for a match
+
+    Returns:
+        int -- Number of matches
+    """
+    used_truth     = set()
+    used_detection = set()
+    for distance, i, j in sorted(distances):
+        if distance > tolerance:
+            break
+        if i in used_truth or j in used_detection:
+            continue
+        used_truth.add(i)
+        used_detection.add(j)
+    return len(used_truth)
+
+def loadPoints(zip_path):
+    """Read the spots saved by count_3D_FISH.py
+
+    Arguments:
+        zip_path {str} -- Path to the zip with the point ROIs
+
+    Returns:
+        list -- Positions in pixels and slices, empty if no file was saved
+    """
+    if not os.path.exists(zip_path):
+        return []
+    rm = RoiManager(False)
+    rm.runCommand("Open", zip_path)
+    points = []
+    for roi in rm.getRoisAsArray():
+        polygon = roi.getFloatPolygon()
+        # The script adds 0.5 to the positions, Z position is 1-based
+        points.append([polygon.xpoints[0] - 0.5, polygon.ypoints[0] - 0.5,
+                       roi.getZPosition() - 1])
+    rm.close()
+    return points
+
+def scoreFISH(case_dir, name, truth):
+    """Compare the spots found by count_3D_FISH.py to the ground truth
+
+    Arguments:
+        case_dir {str} -- Folder of the benchmark case
+        name {str}     -- Name of the phantom
+        truth {dict}   -- Ground truth of the phantom
+
+    Returns:
+        list -- Matches, detections, true spots and counting error for each
+                ROI and channel
+    """
+    scores = []
+    for roi_index, roi_truth in enumerate(truth["rois"]):
+        for channel, true_spots in sorted(roi_truth["spots"].items()):
+            zip_path = os.path.join(case_dir, name, "ROI" + str(roi_index + 1),
+                                    name + "_ROI_" + str(roi_index + 1) + "_dots_C" + channel + ".zip")
+            detected  = loadPoints(zip_path)
+            distances = []
+            for i, spot in enumerate(true_spots):
+                for j, point in enumerate(detected):
+                    distances.append((math.sqrt(((spot[0] - point[0]) * pixel_width) ** 2 +
+                                                ((spot[1] - point[1]) * pixel_width) ** 2 +
+                                                ((spot[2] - point[2]) * pixel_depth) ** 2), i, j))
+            matches = matchPairs(distances, 2 * spot_radii[int(channel)])
+            scores.append((matches, len(detected), len(true_spots),
+                           abs(len(detected) - len(true_spots)) / float(max(1, len(true_spots)))))
+    return scores
+
+def scoreFISHResults(case_dir, name, truth):
+    """Compare the counts and densities in the CSV of count_3D_FISH.py to the ground truth
+
+    A ROI missing from the CSV counts as a full error.
+
+    Arguments:
+        case_dir {str} -- Folder of the benchmark case
+        name {str}     -- Name of the phantom
+        truth {dict}   -- Ground truth of the phantom
+
+    Returns:
+        list -- Relative errors on the count and the density for each ROI
+                and channel
+    """
+    csv_path = os.path.join(case_dir, name, name + "_Results.csv")
+    rows     = {}
+    if os.path.exists(csv_path):
+        with open(csv_path, "rb") as f:
+            # The header is a single cell, the rows are one column per value
+            for row in list(csv.reader(f))[1:]:
+                if len(row) == 9 and row[0] == name:
+                    rows[int(row[1])] = row
+
+    # Columns of the count and density for each channel
+    columns = {"2": (3, 4), "3": (5, 6), "4": (7, 8)}
+    errors  = []
+    for roi_index, roi_truth in enumerate(truth["rois"]):
+        row = rows.get(roi_index + 1)
+        for channel, true_spots in sorted(roi_truth["spots"].items()):
+            if row is None:
+                errors.append((1.0, 1.0))
+                continue
+            true_count   = len(true_spots)
+            true_density = true_count / roi_truth["area"]
+            count   = float(row[columns[channel][0]])
+            density = float(row[columns[channel][1]])
+            errors.append((abs(count - true_count) / max(1, true_count),
+                           abs(density - true_density) / true_density if true_density else density))
+    return errors
+
+def scoreNuclei(case_dir, name, truth):
+    """Compare the nuclei found by H_watershed_3D_nuclei.py to the ground truth
+
+    A nucleus is found if the centroid of an object is inside its ellipsoid.
+
+    Arguments:
+        case_dir {str} -- Folder of the benchmark case
+        name {str}     -- Name of the phantom
+        truth {dict}   -- Ground truth of the phantom
+
+    Returns:
+        list -- Matches, detections, true nuclei and relative volume error
+                of each match
+    """
+    zip_path = os.path.join(case_dir, name, name + "_filtered_objects.zip")
+    objects  = []
+    if os.path.exists(zip_path):
+        pop = Objects3DPopulation()
+        pop.loadObjects(zip_path)
+        for i in range(pop.getNbObjects()):
+            obj = pop.getObject(i)
+            objects.append(([obj.getCenterX(), obj.getCenterY(), obj.getCenterZ()],
+                            obj.getVolumeUnit()))
+
+    nuclei    = truth["nuclei"]
+    distances = []
+    for i, nucleus in enumerate(nuclei):
+        for j, (center, volume) in enumerate(objects):
+            distance = math.sqrt(sum([((center[k] - nucleus["center"][k]) / nucleus["axes"][k]) ** 2
+                                      for k in range(3)]))
+            distances.append((distance, i, j))
+
+    # Same greedy matching as for spots, keeping track of the pairs
+    volume_errors  = []
+    used_truth     = set()
+    used_detection = set()
+    for distance, i, j in sorted(distances):
+        if distance > 1:
+            break
+        if i in used_truth or j in used_detection:
+            continue
+        used_truth.add(i)
+        used_detection.add(j)
+        volume_errors.append(abs(objects[j][1] - nuclei[i]["volume"]) / nuclei[i]["volume"])
+    return len(used_truth), len(objects), len(nuclei), volume_errors
+
+def getAccuracy(matches, detected, expected):
+    """Compute precision, recall and F1 score
+
+    Arguments:
+        matches {int}  -- Number of matched detections
+        detected {int} -- Number of detections
+        expected {int} -- Number of ground truth objects
+
+    Returns:
+        dict -- Counts and scores
+    """
+    precision = matches / float(detected) if detected else 1.0
+    recall    = matches / float(expected) if expected else 1.0
+    f1        = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"tp": matches, "fp": detected - matches, "fn": expected - matches,
+            "precision": precision, "recall": recall, "f1": f1}
+
+def resetResidentPeak():
+    """Reset the resident memory high-water mark of the JVM
+
+    Only possible on Linux, so that the peak in the profiling summary only
+    covers the run that follows.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except IOError:
+        pass
+
+def readProfileSummary(case_dir, script_name):
+    """Read the resources used by a script from its profiling summary
+
+    The scripts reset the heap peak at every stage, so the peak of the whole
+    run is the highest of the stages. Same for the resident peak, reset by
+    resetResidentPeak before the run.
+
+    Arguments:
+        case_dir {str}    -- Folder given to the script
+        script_name {str} -- Name of the script without extension
+
+    Returns:
+        dict -- Wall time in seconds for each stage, total CPU time in seconds
+                and memory peaks in MB, empty if the summary was not saved
+    """
+    summaries = sorted(glob.glob(os.path.join(case_dir, script_name + "_*_summary.csv")))
+    if not summaries:
+        return {}
+    with open(summaries[-1], "rb") as f:
+        rows = list(csv.reader(f))[1:]
+    if not rows:
+        return {}
+    rss_peak = max([float(row[5]) for row in rows])
+    return {"stages"      : dict([(row[0], float(row[2])) for row in rows]),
+            "cpu_s"       : sum([float(row[3]) for row in rows]),
+            "heap_peak_mb": max([float(row[4]) for row in rows]),
+            # The scripts write 0 when the resident memory is not available
+            "rss_peak_mb" : rss_peak if rss_peak > 0 else None}
+
+def runPipeline(script_name, inputs):
+    """Run one of the analysis scripts and time it
+
+    Arguments:
+        script_name {str} -- Name of the script without extension
+        inputs {dict}     -- Values for the script parameters
+
+    Returns:
+        dict -- Wall time in seconds and the error message if the script failed
+    """
+    script_file = File(scripts_dir, script_name + ".py")
+    java_inputs = HashMap()
+    for key, value in inputs.items():
+        java_inputs.put(key, value)
+
+    System.gc()
+    resetResidentPeak()
+    start_wall = System.nanoTime()
+    error      = None
+    try:
+        scripts.run(script_file, True, java_inputs).get()
+    except Exception as e:
+        error = str(e)
+        IJ.log("    " + script_name + " failed: " + error)
+    wall = (System.nanoTime() - start_wall) / 1e9
+    return {"wall_s": wall, "error": error}
+
+def benchmarkCase(run_dir, case_name, kind, size, n_rois, density, n_nuclei):
+    """Generate the phantoms of a case, run its pipeline and score it
+
+    Arguments:
+        run_dir {str}    -- Folder of the benchmark run
+        case_name {str}  -- Name of the case, used to compare versions
+        kind {str}       -- Either "fish" or "nuclei"
+        size {tuple}     -- Width, height and depth of the stacks
+        n_rois {int}     -- Number of ROIs per image
+        density {float}  -- Number of spots per um2
+        n_nuclei {int}   -- Number of nuclei per image
+
+    Returns:
+        dict -- Results of the case, None if only the phantoms are generated
+    """
+    IJ.log("Case " + case_name)
+    case_dir = os.path.join(run_dir, case_name)
+    os.makedirs(case_dir)
+    rnd    = getCaseRandom(case_name)
+    truths = {}
+    for index in range(images_per_case):
+        name = case_name + "_" + str(index + 1)
+        truths[name] = generatePhantom(os.path.join(case_dir, name), kind, size,
+                                       n_rois, density, n_nuclei, rnd)
+        if len(truths[name]["nuclei"]) < n_nuclei:
+            IJ.log("    Warning: only %d of %d nuclei fit in %s" %
+                   (len(truths[name]["nuclei"]), n_nuclei, name))
+    if generate_only:
+        return None
+
+    if kind == "fish":
+        script_name = "count_3D_FISH"
+        inputs = {"src_dir": File(case_dir), "filename_filter": ".tif",
+                  "do_profile": True}
+    else:
+        script_name = "H_watershed_3D_nuclei"
+        inputs = {"src_dir": File(case_dir), "filename_filter": ".tif",
+                  "min_volume": min_volume, "min_intensity_DAPI": min_intensity_DAPI,
+                  "filter_objects_touching_z": False, "do_profile": True}
+    IJ.log("    Running " + script_name)
+    result = runPipeline(script_name, inputs)
+    # CPU time and memory come from the profiling of the script itself
+    result.update({"stages": {}, "cpu_s": None, "heap_peak_mb": None, "rss_peak_mb": None})
+    result.update(readProfileSummary(case_dir, script_name))
+
+    width, height, depth = size
+    voxels = width * height * depth * n_channels * images_per_case
+    result.update({
+        "pipeline"        : script_name,
+        "case"            : case_name,
+        "stack_size"      : list(size),
+        "rois"            : n_rois,
+        "spot_density"    : density,
+        "nuclei_requested": n_nuclei,
+        "nuclei"          : sum([len(truth["nuclei"]) for truth in truths.values()]),
+        "images"          : images_per_case,
+        "voxels"          : voxels,
+        "throughput_mvox_s": voxels / 1e6 / result["wall_s"]})
+
+    if kind == "fish":
+        scores = []
+        for name, truth in sorted(truths.items()):
+            scores += scoreFISH(case_dir, name, truth)
+        accuracy = getAccuracy(sum([s[0] for s in scores]), sum([s[1] for s in scores]),
+                               sum([s[2] for s in scores]))
+        accuracy["count_error"] = sum([s[3] for s in scores]) / max(1, len(scores))
+        csv_scores = []
+        for name, truth in sorted(truths.items()):
+            csv_scores += scoreFISHResults(case_dir, name, truth)
+        accuracy["csv_count_error"] = sum([s[0] for s in csv_scores]) / max(1, len(csv_scores))
+        accuracy["density_error"]   = sum([s[1] for s in csv_scores]) / max(1, len(csv_scores))
+    else:
+        matches = detected = expected = 0
+        volume_errors = []
+        for name, truth in sorted(truths.items()):
+            score = scoreNuclei(case_dir, name, truth)
+            matches  += score[0]
+            detected += score[1]
+            expected += score[2]
+            volume_errors += score[3]
+        accuracy = getAccuracy(matches, detected, expected)
+        accuracy["volume_error"] = (sum(volume_errors) / len(volume_errors)
+                                    if volume_errors else None)
+    result["accuracy"] = accuracy
+    IJ.log("    %.2f s, %.2f Mvoxels/s, F1 %.3f" %
+           (result["wall_s"], result["throughput_mvox_s"], accuracy["f1"]))
+    return result
+
+def compareResults(results, reference_path, out_path):
+    """Compare the results to a previous benchmark and save the differences
+
+    Arguments:
+        results {list}       -- Results of the current run
+        reference_path {str} -- JSON file of the previous run
+        out_path {str}       -- CSV file where to save the comparison
+    """
+    with open(reference_path) as f:
+        reference = json.load(f)
+    previous = dict([((r["pipeline"], r["case"]), r) for r in reference["results"]])
+
+    header = ["Pipeline", "Case", "Throughput ratio", "Heap peak ratio", "F1 difference"]
+    rows   = []
+    for result in results:
+        old = previous.get((result["pipeline"], result["case"]))
+        if old is None:
+            continue
+        heap_ratio = None
+        if result["heap_peak_mb"] and old.get("heap_peak_mb"):
+            heap_ratio = round(result["heap_peak_mb"] / old["heap_peak_mb"], 3)
+        rows.append([result["pipeline"], result["case"],
+                     round(result["throughput_mvox_s"] / old["throughput_mvox_s"], 3),
+                     heap_ratio,
+                     round(result["accuracy"]["f1"] - old["accuracy"]["f1"], 3)])
+
+    with open(out_path, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+    IJ.log("Comparison to " + reference["meta"]["version_label"])
+    IJ.log("\t".join(header))
+    for row in rows:
+        IJ.log("\t".join([str(x) for x in row]))
+
+# ─── MAIN CODE ──────────────────────────────────────────────────────────────────
+
+IJ.log("\\Clear")
+IJ.log("STARTING")
+
+scripts_dir = str(scripts_dir)
+out_dir     = str(out_dir)
+run_name    = "benchmark_" + version_label + "_" + time.strftime("%Y%m%d_%H%M%S")
+run_dir     = os.path.join(out_dir, run_name)
+
+sizes     = [parseSize(x) for x in parseList(stack_sizes, str)]
+rois_list = parseList(roi_counts, int)
+densities = parseList(spot_densities, float)
+nuclei_list = parseList(nuclei_counts, int)
+
+fish_nuclei    = min(nuclei_list) if nuclei_list else default_nuclei
+nuclei_density = min(densities) if densities else default_density
+
+if not sizes:
+    IJ.log("No stack size given, nothing to benchmark.")
+if pipelines in ["both", "count_3D_FISH"] and not (rois_list and densities):
+    IJ.log("No number of ROIs or spot density given, count_3D_FISH will be skipped.")
+if pipelines in ["both", "H_watershed_3D_nuclei"] and not nuclei_list:
+    IJ.log("No number of nuclei given, H_watershed_3D_nuclei will be skipped.")
+
+results = []
+if pipelines in ["both", "count_3D_FISH"]:
+    for size in sizes:
+        for n_rois in rois_list:
+            for density in densities:
+                case_name = "fish_%dx%dx%d_r%d_d%g" % (size + (n_rois, density))
+                result = benchmarkCase(run_dir, case_name, "fish", size,
+                                       n_rois, density, fish_nuclei)
+                if result is not None:
+                    results.append(result)
+
+if pipelines in ["both", "H_watershed_3D_nuclei"]:
+    for size in sizes:
+        for n_nuclei in nuclei_list:
+            case_name = "nuclei_%dx%dx%d_n%d" % (size + (n_nuclei,))
+            result = benchmarkCase(run_dir, case_name, "nuclei", size,
+                                   1, nuclei_density, n_nuclei)
+            if result is not None:
+                results.append(result)
+
+if results:
+    meta = {
+        "version_label" : version_label,
+        "date"          : time.strftime("%Y-%m-%d %H:%M:%S"),
+        "imagej_version": IJ.getFullVersion(),
+        "java_version"  : System.getProperty("java.version"),
+        "os"            : System.getProperty("os.name") + " " + System.getProperty("os.arch"),
+        "processors"    : Runtime.getRuntime().availableProcessors(),
+        "max_heap_mb"   : Runtime.getRuntime().maxMemory() / 1048576.0,
+        "seed"          : seed,
+        "images_per_case": images_per_case}
+    with open(os.path.join(out_dir, run_name + ".json"), "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+
+    # Flat version of the results for spreadsheets
+    header = ["pipeline", "case", "voxels", "wall_s", "cpu_s", "throughput_mvox_s",
+              "heap_peak_mb", "rss_peak_mb", "precision", "recall", "f1",
+              "count_error", "csv_count_error", "density_error", "volume_error",
+              "nuclei", "error"]
+    with open(os.path.join(out_dir, run_name + ".csv"), 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for result in results:
+            row = dict(result)
+            row.update(result["accuracy"])
+            writer.writerow([row.get(key) for key in header])
+
+    if reference_results:
+        compareResults(results, reference_results,
+                       os.path.join(out_dir, run_name + "_comparison.csv"))
+
+IJ.log('###########################')
+IJ.log('Script done')
+IJ.log('###########################')
@@ -23,6 +23,7 @@ Date            By      Comments
 
 #@ File(label="Select the directory with your cropped images", style="directory") src_dir
 #@ String(label="Extension for the images to look for") filename_filter
+#@ Boolean(label="Profile the pipeline", description="Save the time and memory used by each step as a trace and a summary table", value=False) do_profile
 
 # ─── IMPORTS ────────────────────────────────────────────────────────────────────
 
@@ -32,6 +33,8 @@ from net.imglib2.img.display.imagej import ImageJFunctions
 import os
 import csv
 import glob
+import json
+import time
 from itertools import izip
 
 from ij import IJ, ImagePlus, ImageStack, WindowManager as wm
@@ -41,6 +44,10 @@ from ij.measure import ResultsTable
 from ij.process import ImageConverter
 from ij.plugin import Duplicator, ImageCalculator
 
+# Profiling imports
+from java.lang import System, Thread
+from java.lang.management import ManagementFactory, MemoryType
+
 
 # Bioformats imports
 from loci.plugins import BF
@@ -114,6 +121,163 @@ def BFImport(indivFile):
     imps = BF.openImagePlus(options)
     return imps
 
+def getProcessCpuTime():
+    """Get the CPU time used so far by the JVM
+
+    Uses the CPU time of the whole process so that multithreaded filters
+    are accounted for, and falls back to the current thread otherwise.
+
+    Returns:
+        long -- CPU time in nanoseconds
+    """
+    if process_cpu_available:
+        return os_bean.getProcessCpuTime()
+    return ManagementFactory.getThreadMXBean().getCurrentThreadCpuTime()
+
+def getResidentMemory():
+    """Read the current and peak resident set size of the JVM
+
+    Only available on Linux through /proc.
+
+    Returns:
+        tuple -- Current and peak RSS in bytes, (None, None) if not available
+    """
+    rss = rss_peak = None
+    if not os.path.exists("/proc/self/status"):
+        return rss, rss_peak
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss = int(line.split()[1]) * 1024
+            elif line.startswith("VmHWM:"):
+                rss_peak = int(line.split()[1]) * 1024
+    return rss, rss_peak
+
+def getVoxelCount(implus):
+    """Get the number of voxels in all the planes of an image
+
+    Arguments:
+        implus {imagePlus} -- ImagePlus to count the voxels of
+
+    Returns:
+        long -- Number of voxels
+    """
+    return long(implus.getWidth()) * implus.getHeight() * implus.getStackSize()
+
+def startStage(name, **args):
+    """Start recording a stage of the pipeline
+
+    Does nothing if profiling is off. Stages are not meant to be nested
+    as the heap peak usage is reset at every start.
+
+    Arguments:
+        name {str} -- Name of the stage, used to group them in the summary
+        args       -- Extra information to store with the stage (file, ROI...)
+
+    Returns:
+        dict -- Stage being recorded, None if profiling is off
+    """
+    if not do_profile:
+        return None
+    for pool in heap_pools:
+        pool.resetPeakUsage()
+    return {"name": name, "args": args,
+            "wall": System.nanoTime(), "cpu": getProcessCpuTime()}
+
+def endStage(stage, implus=None, objects=None):
+    """Stop recording a stage and store it as a trace event
+
+    Arguments:
+        stage {dict} -- Stage returned by startStage
+
+    Keyword Arguments:
+        implus {imagePlus or list} -- Images made or processed in the stage, for the voxel count (default: {None})
+        objects {int}              -- Number of spots or objects found in the stage (default: {None})
+    """
+    if stage is None:
+        return
+    wall = System.nanoTime() - stage["wall"]
+    cpu  = getProcessCpuTime() - stage["cpu"]
+    rss, rss_peak = getResidentMemory()
+
+    args = stage["args"]
+    args["cpu_ms"]    = cpu / 1e6
+    # Each pool peaks at its own time, so this sum is an upper bound of the heap peak
+    args["heap_peak"] = sum([pool.getPeakUsage().getUsed() for pool in heap_pools])
+    args["rss"]       = rss
+    args["rss_peak"]  = rss_peak
+    if isinstance(implus, list):
+        args["voxels"] = sum([getVoxelCount(x) for x in implus])
+    else:
+        args["voxels"] = getVoxelCount(implus) if implus is not None else None
+    args["objects"]   = objects
+
+    # Complete event of the Chrome trace format, times in microseconds
+    profile_events.append({
+        "name": stage["name"],
+        "cat" : "pipeline",
+        "ph"  : "X",
+        "pid" : 1,
+        "tid" : Thread.currentThread().getId(),
+        "ts"  : (stage["wall"] - profile_origin) / 1e3,
+        "dur" : wall / 1e3,
+        "args": args})
+
+def writeProfile(out_dir, run_name):
+    """Save the recorded stages as a Chrome trace and a summary table
+
+    The trace can be opened in chrome://tracing or https://ui.perfetto.dev,
+    the summary is saved as a CSV and printed in the log window.
+
+    Arguments:
+        out_dir {str}  -- Folder where to save the files
+        run_name {str} -- Prefix for the files names
+    """
+    if not profile_events:
+        return
+
+    trace_path = os.path.join(out_dir, run_name + "_trace.json")
+    with open(trace_path, "w") as f:
+        json.dump({"traceEvents": profile_events, "displayTimeUnit": "ms"}, f)
+
+    # Aggregate the stages by name, keeping the order of first appearance
+    names   = []
+    summary = {}
+    for event in profile_events:
+        name = event["name"]
+        args = event["args"]
+        if name not in summary:
+            names.append(name)
+            summary[name] = [0, 0.0, 0.0, 0, 0, 0, 0]
+        row = summary[name]
+        row[0] += 1
+        row[1] += event["dur"] / 1e6
+        row[2] += args["cpu_ms"] / 1e3
+        row[3]  = max(row[3], args["heap_peak"])
+        row[4]  = max(row[4], args["rss_peak"] or 0)
+        row[5] += args["voxels"] or 0
+        row[6] += args["objects"] or 0
+
+    header = ["Stage", "Calls", "Wall time (s)", "CPU time (s)",
+              "Heap peak, sum of pools (MB)", "RSS peak (MB)", "Voxels", "Objects"]
+    rows = []
+    for name in names:
+        calls, wall, cpu, heap_peak, rss_peak, voxels, objects = summary[name]
+        rows.append([name, calls, round(wall, 3), round(cpu, 3),
+                     round(heap_peak / 1048576.0, 1), round(rss_peak / 1048576.0, 1),
+                     voxels, objects])
+
+    summary_path = os.path.join(out_dir, run_name + "_summary.csv")
+    with open(summary_path, 'wb') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+    IJ.log("Profiling summary, trace saved in " + trace_path)
+    IJ.log("\t".join(header))
+    for row in rows:
+        IJ.log("\t".join([str(x) for x in row]))
+
 
 def count_cellDetection3D(implus, current_channel, rad, thresh, subpix, med, bbox, save_file):
     """Function to detect the cells in 3D using TrackMate
@@ -229,6 +393,18 @@ src_dir = str(src_dir)
 files = getFileList(src_dir, filename_filter)
 IJ.setBackgroundColor(0, 0, 0)
 
+# Profiling setup, only the start and end of each stage are timed
+profile_events = []
+profile_origin = System.nanoTime()
+heap_pools     = [pool for pool in ManagementFactory.getMemoryPoolMXBeans()
+                  if pool.getType() == MemoryType.HEAP]
+os_bean        = ManagementFactory.getOperatingSystemMXBean()
+try:
+    os_bean.getProcessCpuTime()
+    process_cpu_available = True
+except Exception:
+    process_cpu_available = False
+
 # If the list of files is not empty
 if files:
     # Lists for the result file
@@ -241,177 +417,205 @@ if files:
     ch4_density = []
     
     # For each file finishing with the filtered string
-    for file in files:
-        # Get info for the files
-        IJ.log("\\Clear")
-        folder   = os.path.dirname(file)
-        basename = os.path.basename(file)
-        basename = os.path.splitext(basename)[0]
-        roi_zip  = os.path.join(folder, basename + ".zip")
-        # print roi_zip
-
-        if not os.path.exists(roi_zip):
-            IJ.log("Couldn't find the ROIs for image " + basename + ", will skip it.")
-            continue
-
-        # Import the file with BioFormats
+    # Save the profiling even if an image fails so that the batch can be checked
+    try:
+        for file in files:
+            # Get info for the files
+            IJ.log("\\Clear")
+            folder   = os.path.dirname(file)
+            basename = os.path.basename(file)
+            basename = os.path.splitext(basename)[0]
+            roi_zip  = os.path.join(folder, basename + ".zip")
+            # print roi_zip
+
+            if not os.path.exists(roi_zip):
+                IJ.log("Couldn't find the ROIs for image " + basename + ", will skip it.")
+                continue
+
+            # Import the file with BioFormats
         
-        IJ.log("Currently opening " + basename + "...")
-        imps = BFImport(str(file))
+            IJ.log("Currently opening " + basename + "...")
+            stage = startStage("load", file=basename)
+            imps = BFImport(str(file))
+            endStage(stage, imps[0] if imps else None)
 
-        for imp in imps:
+            for imp in imps:
 
-            # imp.show()
-            # Add points to ROI manager
+                # imp.show()
                 # Add points to ROI manager
-            rm_image = RoiManager(False)
-            # rm_image.reset()
-
-            rm_image.runCommand("Open", roi_zip)
-            rois_image = rm_image.getRoisAsArray()
-            if rm_image.getCount() == 0:
-                IJ.log("Couldn't load the ROIs for this image. Check what happened.")
-                continue
-
-            zip_folder = os.path.join(folder,"zip_folder")
-
-            roi_area_list = []
-            # rm.close()
-
-            for roi_index in range(rm_image.getCount()):
-                out_ROI_folder = os.path.join(folder,basename,"ROI" + str(roi_index+1))
-                if not os.path.exists(out_ROI_folder):
-                    os.makedirs(out_ROI_folder)
-                IJ.log("Working on ROI " + str(roi_index))
-                # imp.setRoi(roi)
-                rm_image.select(imp, roi_index)
-                roi_area = imp.getStatistics().area
-                # print roi_area
-                roi_area_list.append(roi_area)
-                current_roi = rm_image.getRoi(roi_index)
-                bounding_box = current_roi.getBounds()
-                # print bounding_box
-                # sys.exit(0)
-
-                # Calculate the number of cells in channel 2
-                IJ.log("Looking into Channel 2")
-                channel_of_interest = 2
-                imp_for_tm2 = Duplicator().run(imp, channel_of_interest,
-                                            channel_of_interest, 1, imp.getNSlices(), 1, 1)
-                imp_for_tm2.setCalibration(imp.getCalibration())
-                # Clear outside the ROI 
-                rm_image.select(imp_for_tm2, roi_index)
+                    # Add points to ROI manager
+                stage = startStage("load", file=basename)
+                rm_image = RoiManager(False)
+                # rm_image.reset()
+
+                rm_image.runCommand("Open", roi_zip)
+                endStage(stage)
+                rois_image = rm_image.getRoisAsArray()
+                if rm_image.getCount() == 0:
+                    IJ.log("Couldn't load the ROIs for this image. Check what happened.")
+                    continue
+
+                zip_folder = os.path.join(folder,"zip_folder")
+
+                roi_area_list = []
+                # rm.close()
+
+                for roi_index in range(rm_image.getCount()):
+                    out_ROI_folder = os.path.join(folder,basename,"ROI" + str(roi_index+1))
+                    if not os.path.exists(out_ROI_folder):
+                        os.makedirs(out_ROI_folder)
+                    IJ.log("Working on ROI " + str(roi_index))
+                    # imp.setRoi(roi)
+                    stage = startStage("measurement", file=basename, roi=roi_index + 1)
+                    rm_image.select(imp, roi_index)
+                    roi_area = imp.getStatistics().area
+                    endStage(stage)
+                    # print roi_area
+                    roi_area_list.append(roi_area)
+                    current_roi = rm_image.getRoi(roi_index)
+                    bounding_box = current_roi.getBounds()
+                    # print bounding_box
+                    # sys.exit(0)
+
+                    # Calculate the number of cells in channel 2
+                    IJ.log("Looking into Channel 2")
+                    channel_of_interest = 2
+                    stage = startStage("duplicate", file=basename, roi=roi_index + 1, channel=channel_of_interest)
+                    imp_for_tm2 = Duplicator().run(imp, channel_of_interest,
+                                                channel_of_interest, 1, imp.getNSlices(), 1, 1)
+                    imp_for_tm2.setCalibration(imp.getCalibration())
+                    # Clear outside the ROI 
+                    rm_image.select(imp_for_tm2, roi_index)
                 
-                # imp_for_tm2.setRoi(roi)
-                # imp_for_tm2.show()
+                    # imp_for_tm2.setRoi(roi)
+                    # imp_for_tm2.show()
 
-                IJ.run(imp_for_tm2, "Clear Outside", "stack")
-                # imp_for_tm2.show()
+                    IJ.run(imp_for_tm2, "Clear Outside", "stack")
+                    endStage(stage, imp_for_tm2)
+                    # imp_for_tm2.show()
 
-                roi_C2_zip  = os.path.join(out_ROI_folder, basename + "_ROI_" + str(roi_index+1) + "_dots_C2.zip")
+                    roi_C2_zip  = os.path.join(out_ROI_folder, basename + "_ROI_" + str(roi_index+1) + "_dots_C2.zip")
 
 
-                # Get the marker image with the peaks of cells using TrackMate
-                cell_count_ch2 = count_cellDetection3D(
-                    imp_for_tm2, channel_of_interest ,radius_C2, threshold_C2, doSubpixel, doMedian, bounding_box, roi_C2_zip)
-                # print rm_image.getCount()
+                    # Get the marker image with the peaks of cells using TrackMate
+                    stage = startStage("detection", file=basename, roi=roi_index + 1, channel=channel_of_interest)
+                    cell_count_ch2 = count_cellDetection3D(
+                        imp_for_tm2, channel_of_interest ,radius_C2, threshold_C2, doSubpixel, doMedian, bounding_box, roi_C2_zip)
+                    endStage(stage, imp_for_tm2, cell_count_ch2)
+                    # print rm_image.getCount()
 
-                # rois_C2 = rm.getRoisAsArray()
-                # rm_image.runCommand("Save", roi_C2_zip)
+                    # rois_C2 = rm.getRoisAsArray()
+                    # rm_image.runCommand("Save", roi_C2_zip)
 
                 
 
-                # Calculate the number of cells in channel 3
-                IJ.log("Looking into Channel 3")
-                channel_of_interest = 3
-                imp_for_tm3 = Duplicator().run(imp, channel_of_interest,
-                                            channel_of_interest, 1, imp.getNSlices(), 1, 1)
+                    # Calculate the number of cells in channel 3
+                    IJ.log("Looking into Channel 3")
+                    channel_of_interest = 3
+                    stage = startStage("duplicate", file=basename, roi=roi_index + 1, channel=channel_of_interest)
+                    imp_for_tm3 = Duplicator().run(imp, channel_of_interest,
+                                                channel_of_interest, 1, imp.getNSlices(), 1, 1)
                 
-                imp_for_tm3.setCalibration(imp.getCalibration())
-
-                # Clear outside the ROI 
-                rm_image.select(imp_for_tm3, roi_index)
-                # imp_for_tm3.setRoi(roi)
-                IJ.run(imp_for_tm3, "Clear Outside", "stack")
-
-                roi_C3_zip  = os.path.join(out_ROI_folder, basename + "_ROI_" + str(roi_index+1) + "_dots_C3.zip")
-
-                # Get the marker image with the peaks of cells using TrackMate
-                cell_count_ch3 = count_cellDetection3D(
-                    imp_for_tm3, channel_of_interest ,radius_C3, threshold_C3, doSubpixel, doMedian, bounding_box, roi_C3_zip)
-
-                # rois_C2 = rm.getRoisAsArray()
-                # rm.runCommand("Save", roi_C3_zip)
-
-                # Calculate the number of cells in channel 4
-                IJ.log("Looking into Channel 4")
-                channel_of_interest = 4
-                imp_for_tm4 = Duplicator().run(imp, channel_of_interest,
-                                            channel_of_interest, 1, imp.getNSlices(), 1, 1)
-
-                imp_for_tm4.setCalibration(imp.getCalibration())
-
-                imp_for_bgd = Duplicator().run(imp, channel_of_interest,
-                                            channel_of_interest, 1, imp.getNSlices(), 1, 1)
-                imp_for_bgd.setCalibration(imp.getCalibration())
-
-                # Clear outside the ROI
-                # rm.select(imp_for_tm4, roi_index)
-                # IJ.run(imp_for_tm4, "Clear Outside", "")
-                # rm.select(imp_for_bgd, roi_index)
-                # IJ.run(imp_for_bgd, "Clear Outside", "")
-
-                # Background subtraction
-                ic = ImageCalculator()
-                IJ.run(imp_for_bgd, "Gaussian Blur...", "sigma=20 stack")
-                imp_minus_bgd = ic.run("Subtract create stack", imp_for_tm4, imp_for_bgd)
-                imp_minus_bgd.setCalibration(imp.getCalibration())
-
-                IJ.run(imp_minus_bgd, "Median 3D...", "x=2 y=2 z=2")
-                # Clear outside the ROI
-                rm_image.select(imp_minus_bgd, roi_index)
-                # imp_minus_bgd.setRoi(roi)
-                IJ.run(imp_minus_bgd, "Clear Outside", "stack")                    
-
-                roi_C4_zip  = os.path.join(out_ROI_folder, basename + "_ROI_" + str(roi_index+1) + "_dots_C4.zip")
-
-                # imp_minus_bgd.show()
-
-                # Get the marker image with the peaks of cells using TrackMate
-                cell_count_ch4 = count_cellDetection3D(
-                    imp_minus_bgd, channel_of_interest, radius_C4, threshold_C4, doSubpixel, doMedian, bounding_box, roi_C4_zip)
-                # rois_C2 = rm.getRoisAsArray()
-                # rm.runCommand("Save", roi_C4_zip)
-
-                imp.close()
-                imp_for_tm2.close()
-                imp_for_tm3.close()
-                imp_for_tm4.close()
-                imp_for_bgd.close()
-                imp_minus_bgd.close()                
-
-                name_list.append(basename)
-                ch2_count.append(cell_count_ch2)
-                ch3_count.append(cell_count_ch3)
-                ch4_count.append(cell_count_ch4)
+                    imp_for_tm3.setCalibration(imp.getCalibration())
+
+                    # Clear outside the ROI 
+                    rm_image.select(imp_for_tm3, roi_index)
+                    # imp_for_tm3.setRoi(roi)
+                    IJ.run(imp_for_tm3, "Clear Outside", "stack")
+                    endStage(stage, imp_for_tm3)
+
+                    roi_C3_zip  = os.path.join(out_ROI_folder, basename + "_ROI_" + str(roi_index+1) + "_dots_C3.zip")
+
+                    # Get the marker image with the peaks of cells using TrackMate
+                    stage = startStage("detection", file=basename, roi=roi_index + 1, channel=channel_of_interest)
+                    cell_count_ch3 = count_cellDetection3D(
+                        imp_for_tm3, channel_of_interest ,radius_C3, threshold_C3, doSubpixel, doMedian, bounding_box, roi_C3_zip)
+                    endStage(stage, imp_for_tm3, cell_count_ch3)
+
+                    # rois_C2 = rm.getRoisAsArray()
+                    # rm.runCommand("Save", roi_C3_zip)
+
+                    # Calculate the number of cells in channel 4
+                    IJ.log("Looking into Channel 4")
+                    channel_of_interest = 4
+                    stage = startStage("duplicate", file=basename, roi=roi_index + 1, channel=channel_of_interest)
+                    imp_for_tm4 = Duplicator().run(imp, channel_of_interest,
+                                                channel_of_interest, 1, imp.getNSlices(), 1, 1)
+
+                    imp_for_tm4.setCalibration(imp.getCalibration())
+
+                    imp_for_bgd = Duplicator().run(imp, channel_of_interest,
+                                                channel_of_interest, 1, imp.getNSlices(), 1, 1)
+                    imp_for_bgd.setCalibration(imp.getCalibration())
+                    endStage(stage, [imp_for_tm4, imp_for_bgd])
+
+                    # Clear outside the ROI
+                    # rm.select(imp_for_tm4, roi_index)
+                    # IJ.run(imp_for_tm4, "Clear Outside", "")
+                    # rm.select(imp_for_bgd, roi_index)
+                    # IJ.run(imp_for_bgd, "Clear Outside", "")
+
+                    # Background subtraction
+                    stage = startStage("background", file=basename, roi=roi_index + 1, channel=channel_of_interest)
+                    ic = ImageCalculator()
+                    IJ.run(imp_for_bgd, "Gaussian Blur...", "sigma=20 stack")
+                    imp_minus_bgd = ic.run("Subtract create stack", imp_for_tm4, imp_for_bgd)
+                    imp_minus_bgd.setCalibration(imp.getCalibration())
+                    endStage(stage, imp_minus_bgd)
+
+                    stage = startStage("median", file=basename, roi=roi_index + 1, channel=channel_of_interest)
+                    IJ.run(imp_minus_bgd, "Median 3D...", "x=2 y=2 z=2")
+                    # Clear outside the ROI
+                    rm_image.select(imp_minus_bgd, roi_index)
+                    # imp_minus_bgd.setRoi(roi)
+                    IJ.run(imp_minus_bgd, "Clear Outside", "stack")                    
+                    endStage(stage, imp_minus_bgd)
+
+                    roi_C4_zip  = os.path.join(out_ROI_folder, basename + "_ROI_" + str(roi_index+1) + "_dots_C4.zip")
+
+                    # imp_minus_bgd.show()
+
+                    # Get the marker image with the peaks of cells using TrackMate
+                    stage = startStage("detection", file=basename, roi=roi_index + 1, channel=channel_of_interest)
+                    cell_count_ch4 = count_cellDetection3D(
+                        imp_minus_bgd, channel_of_interest, radius_C4, threshold_C4, doSubpixel, doMedian, bounding_box, roi_C4_zip)
+                    endStage(stage, imp_minus_bgd, cell_count_ch4)
+                    # rois_C2 = rm.getRoisAsArray()
+                    # rm.runCommand("Save", roi_C4_zip)
+
+                    imp.close()
+                    imp_for_tm2.close()
+                    imp_for_tm3.close()
+                    imp_for_tm4.close()
+                    imp_for_bgd.close()
+                    imp_minus_bgd.close()                
+
+                    name_list.append(basename)
+                    ch2_count.append(cell_count_ch2)
+                    ch3_count.append(cell_count_ch3)
+                    ch4_count.append(cell_count_ch4)
             
         
-        outCSV = os.path.join(folder,basename,basename + "_Results.csv")
-
-        ch2_density = [x / y for x,y in zip(ch2_count, roi_area_list)]
-        ch3_density = [x / y for x,y in zip(ch3_count, roi_area_list)]
-        ch4_density = [x / y for x,y in zip(ch4_count, roi_area_list)]
-
-        # print(volList)
-        with open(outCSV, 'wb') as f:
-            writer = csv.writer(f)
-            writer.writerow(
-                ["Filename, ROI_index, ROI_area, Channel 2 count, Channel 2 density, Channel 3 count, Channel 3 density, Channel 4 count, Channel 4 density"])
-            writer.writerows(izip(name_list, range(1,rm_image.getCount() + 1), roi_area_list, ch2_count, ch2_density, ch3_count, ch3_density, ch4_count, ch4_density))
+            stage = startStage("save", file=basename)
+            outCSV = os.path.join(folder,basename,basename + "_Results.csv")
+
+            ch2_density = [x / y for x,y in zip(ch2_count, roi_area_list)]
+            ch3_density = [x / y for x,y in zip(ch3_count, roi_area_list)]
+            ch4_density = [x / y for x,y in zip(ch4_count, roi_area_list)]
+
+            # print(volList)
+            with open(outCSV, 'wb') as f:
+                writer = csv.writer(f)
+                writer.writerow(
+                    ["Filename, ROI_index, ROI_area, Channel 2 count, Channel 2 density, Channel 3 count, Channel 3 density, Channel 4 count, Channel 4 density"])
+                writer.writerows(izip(name_list, range(1,rm_image.getCount() + 1), roi_area_list, ch2_count, ch2_density, ch3_count, ch3_density, ch4_count, ch4_density))
+            endStage(stage, objects=len(roi_area_list))
+
+            rm_image.close()
+    finally:
+        if do_profile:
+            writeProfile(src_dir, "count_3D_FISH_" + time.strftime("%Y%m%d_%H%M%S"))
 
-        rm_image.close()
-
-            
 IJ.log('###########################')
 IJ.log('Script done')
 IJ.log('###########################')